@@ -1,10 +1,17 @@
 import os
+import hmac
+import threading
 import jwt
-from flask import Flask, jsonify, request
+import orjson
+from cachetools import TTLCache
+from flask import Flask, jsonify, request, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from flask_bcrypt import Bcrypt
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from sqlalchemy import event, func
 
 #Get the base directory of the app
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -21,32 +28,107 @@ if not app.config.get("SECRET_KEY"):
     print("WARNING: Using default SECRET_KEY. Please set a strong SECRET_KEY in your config or environment.")
 
 app.config["JWT_EXPIRATION_DELTA"] = timedelta(hours=1) # Token expires in 1 hour (adjust as needed)
+_JWT_TTL = app.config["JWT_EXPIRATION_DELTA"]
+# Encode the signing key once instead of on every token issuance
+_JWT_SIGNING_KEY = app.config["SECRET_KEY"].encode('utf-8')
+# One reusable HS256-only signer. Claims are serialized by us, so issuing a token
+# skips PyJWT's per-call claim copying and JSON encoder setup.
+_jws = jwt.PyJWS(algorithms=["HS256"])
+
+# bcrypt work factor used for new password hashes. Run calibrate_bcrypt.py on the
+# target host to pick a value; existing hashes keep their own cost and are
+# upgraded on the next successful login.
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+
+# Rate limit storage; in-memory limits are per gunicorn worker, so point this at
+# e.g. redis://localhost:6379 to share them across workers.
+app.config['RATELIMIT_STORAGE_URI'] = os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
 
 
 # Database Configuration
 
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'add.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_pre_ping': True,
+    'connect_args': {'check_same_thread': False}
+}
 
 # --- Initialize Extentions ---
 db = SQLAlchemy(app) # Initialize SQLAlchemy with our app
 migrate = Migrate(app, db) #Initialize Flask-Migrate with our app and database
 bcrypt = Bcrypt(app)
+limiter = Limiter(get_remote_address, app=app)
+
+# --- SQLite tuning ---
+# WAL turns each commit into a small append instead of a full rollback-journal
+# rewrite, and synchronous=NORMAL is still crash-safe in WAL mode.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456", # 256 MiB
+)
+
+with app.app_context():
+    @event.listens_for(db.engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+# --- Password verification cache ---
+# bcrypt is deliberately slow, so repeat logins from the same client reuse the
+# last verification result for a short while. Keys are HMACs (never the raw
+# password) that cover the stored hash, so after a password change old entries can
+# no longer match and simply age out.
+_password_check_cache = TTLCache(maxsize=10_000, ttl=60)
+_password_check_cache_lock = threading.Lock()
 
 # --- MODELS ---
 
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
 class User(db.Model): # <<< NEW MODEL
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False) # Increased length for bcrypt hash
-    workouts = db.relationship('SnatchWorkout', backref='user', lazy=True)
+    workouts = db.relationship('SnatchWorkout', back_populates='user', lazy='select')
 
     def set_password(self, password): # <<< NEW METHOD
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = bcrypt.generate_password_hash(
+            password, rounds=app.config['BCRYPT_LOG_ROUNDS']
+        ).decode('utf-8')
 
     def check_password(self, password): # <<< NEW METHOD
-        return bcrypt.check_password_hash(self.password_hash, password)
+        # bcrypt only looks at the first 72 bytes, so don't hand it more than that
+        password_bytes = password.encode('utf-8')[:BCRYPT_MAX_PASSWORD_BYTES]
+        return bcrypt.check_password_hash(self.password_hash, password_bytes)
+
+    def password_needs_rehash(self):
+        """True if the stored hash was made with fewer rounds than currently configured."""
+        # bcrypt hashes look like $2b$<cost>$<salt+hash>
+        stored_rounds = int(self.password_hash.split('$')[2])
+        return stored_rounds < app.config['BCRYPT_LOG_ROUNDS']
+
+    def check_password_cached(self, password):
+        """Like check_password, but skips bcrypt if this exact check ran recently."""
+        cache_key = hmac.new(
+            app.config["SECRET_KEY"].encode('utf-8'),
+            f"{self.id}:{self.password_hash}:{password}".encode('utf-8'),
+            'sha256'
+        ).digest()
+        with _password_check_cache_lock:
+            cached_result = _password_check_cache.get(cache_key)
+        if cached_result is not None:
+            return cached_result
+
+        result = self.check_password(password)
+        with _password_check_cache_lock:
+            _password_check_cache[cache_key] = result
+        return result
 
 
     def __repr__(self):
@@ -59,10 +141,16 @@ class SnatchWorkout(db.Model):
     duration_minutes = db.Column(db.Integer, nullable=False)
     kettlebell_weight_kg = db.Column(db.Float, nullable=False) # Assuming weight in KG
     total_snatches = db.Column(db.Integer, nullable=False)
-    total_weight_moved_kg = db.Column(db.Float, nullable=False) # Calculated field
+    total_weight_moved_kg = db.Column(db.Float, db.Computed('kettlebell_weight_kg * total_snatches', persisted=False)) # Calculated by the database
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     reps_per_interval = db.Column(db.Integer, nullable=False)
+    user = db.relationship('User', back_populates='workouts')
 
+    __table_args__ = (
+        # Matches the LAG() window in get_all_snatch_workouts (PARTITION BY kettlebell_weight_kg
+        # ORDER BY workout_date, id), so SQLite reads it in order instead of sorting
+        db.Index('ix_sw_kb_date', 'kettlebell_weight_kg', 'workout_date', 'id'),
+    )
 
     def __init__(self, reps_per_interval, workout_date, duration_minutes, kettlebell_weight_kg, total_snatches):
         self.reps_per_interval = reps_per_interval
@@ -70,8 +158,6 @@ class SnatchWorkout(db.Model):
         self.duration_minutes = duration_minutes
         self.kettlebell_weight_kg = kettlebell_weight_kg
         self.total_snatches = total_snatches
-        # Calculate total weight moved upon initialization
-        self.total_weight_moved_kg = kettlebell_weight_kg * total_snatches
 
     def __repr__(self):
         return f'<SnatchWorkout {self.id} on {self.workout_date.strftime("%Y-%m-%d")}>'
@@ -80,7 +166,7 @@ class SnatchWorkout(db.Model):
         """Serializes the object to a dictionary."""
         return {
             'id': self.id,
-            'workout_date': self.workout_date.isoformat(), # Format date as YYYY-MM-DD
+            'workout_date': self.workout_date, # Kept as a date; orjson writes YYYY-MM-DD
             'duration_minutes': self.duration_minutes,
             'kettlebell_weight_kg': self.kettlebell_weight_kg,
             'total_snatches': self.total_snatches,
@@ -89,6 +175,29 @@ class SnatchWorkout(db.Model):
             'user_id': self.user_id
         }
 
+def orjson_response(payload, status=200):
+    """Like jsonify, but encodes with orjson (faster, and dates become YYYY-MM-DD)."""
+    return app.response_class(orjson.dumps(payload), status=status, mimetype='application/json')
+
+def _stream_json_array(items):
+    """Yields a JSON array one orjson-encoded item at a time."""
+    yield b'['
+    separator = b''
+    for item in items:
+        yield separator + orjson.dumps(item)
+        separator = b','
+    yield b']'
+
+def parse_workout_date(date_str):
+    """Parses a strict YYYY-MM-DD string into a date.
+
+    date.fromisoformat alone also accepts forms like "20240102" or "2024-W01-2",
+    so check the shape first. Raises ValueError for anything else.
+    """
+    if len(date_str) != 10 or date_str[4] != '-' or date_str[7] != '-':
+        raise ValueError(f"time data {date_str!r} does not match format '%Y-%m-%d'")
+    return date.fromisoformat(date_str)
+
 # --- ROUTES ---
 @app.route('/')
 def hello_world():
@@ -100,6 +209,10 @@ def health_check():
 
 # --- API Endpoints for Snatch Workouts ---
 
+# Tuple order decides which missing field gets reported; the frozenset is for the check itself
+_REQUIRED_WORKOUT_FIELDS_ORDER = ('workout_date_str', 'duration_minutes', 'kettlebell_weight_kg', 'total_snatches')
+_REQUIRED_WORKOUT_FIELDS = frozenset(_REQUIRED_WORKOUT_FIELDS_ORDER)
+
 @app.route('/api/snatch_workouts', methods=['POST'])
 def add_snatch_workout():
     data = request.get_json() # Get data from POST request body
@@ -107,15 +220,18 @@ def add_snatch_workout():
     if not data:
         return jsonify({"error": "No input data provided"}), 400
 
+    if not isinstance(data, dict): # A JSON list or string has no fields to check
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+
     # Validate required fields
-    required_fields = ['workout_date_str', 'duration_minutes', 'kettlebell_weight_kg', 'total_snatches']
-    for field in required_fields:
-        if field not in data:
-            return jsonify({"error": f"Missing field: {field}"}), 400
+    missing_fields = _REQUIRED_WORKOUT_FIELDS - data.keys()
+    if missing_fields:
+        first_missing = next(f for f in _REQUIRED_WORKOUT_FIELDS_ORDER if f in missing_fields)
+        return jsonify({"error": f"Missing field: {first_missing}"}), 400
 
     try:
         # Convert date string (e.g., "YYYY-MM-DD") to date object
-        workout_date_obj = datetime.strptime(data['workout_date_str'], '%Y-%m-%d').date()
+        workout_date_obj = parse_workout_date(data['workout_date_str'])
 
         new_workout = SnatchWorkout(
             workout_date=workout_date_obj,
@@ -125,8 +241,8 @@ def add_snatch_workout():
         )
         db.session.add(new_workout)
         db.session.commit()
-        return jsonify(new_workout.to_dict()), 201 # 201 Created
-    except ValueError as e: # Catches errors from strptime or if data types are wrong for model
+        return orjson_response(new_workout.to_dict(), 201) # 201 Created
+    except ValueError as e: # Catches errors from parse_workout_date or if data types are wrong for model
         db.session.rollback()
         return jsonify({"error": f"Invalid data format: {str(e)}"}), 400
     except Exception as e:
@@ -134,42 +250,75 @@ def add_snatch_workout():
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
 
+# Columns serialized for each workout. Selecting plain columns rather than
+# SnatchWorkout entities returns lightweight Row tuples and skips ORM
+# instantiation and identity-map bookkeeping.
+_WORKOUT_COLUMNS = (
+    SnatchWorkout.id,
+    SnatchWorkout.workout_date,
+    SnatchWorkout.duration_minutes,
+    SnatchWorkout.kettlebell_weight_kg,
+    SnatchWorkout.total_snatches,
+    SnatchWorkout.total_weight_moved_kg,
+    SnatchWorkout.reps_per_interval,
+    SnatchWorkout.user_id,
+)
+
+
+def _percentage_change(current_total_weight_moved, previous_total_weight_moved):
+    """Percent change vs. the previous workout, or None if there is nothing to compare."""
+    if previous_total_weight_moved is None or previous_total_weight_moved <= 0: # Avoid division by zero or if there is no previous workout
+        return None
+    change = current_total_weight_moved - previous_total_weight_moved
+    return round((change / previous_total_weight_moved) * 100, 2) # Round to 2 decimal places
+
+
+def _workouts_with_percentage_change():
+    """Serialized workouts, newest first, with the previous same-weight total from LAG().
+
+    The query runs immediately, but rows are fetched and serialized lazily in batches
+    of 500 as the returned iterator is consumed.
+    """
+    # LAG() hands each row the total weight moved in the previous workout with the
+    # same kettlebell, so the comparison happens in a single pass in the database.
+    previous_total_weight_moved_col = func.lag(SnatchWorkout.total_weight_moved_kg).over(
+        partition_by=SnatchWorkout.kettlebell_weight_kg,
+        order_by=(SnatchWorkout.workout_date.asc(), SnatchWorkout.id.asc())
+    ).label('previous_total_weight_moved_kg')
+    workouts_result = db.session.execute(
+        db.select(*_WORKOUT_COLUMNS, previous_total_weight_moved_col)
+        .order_by(SnatchWorkout.workout_date.desc(), SnatchWorkout.id.asc()) # Newest first for display
+        .execution_options(yield_per=500)
+    )
+    return (_lag_row_to_dict(row) for row in workouts_result)
+
+
+def _lag_row_to_dict(row):
+    # Same shape as SnatchWorkout.to_dict(), plus the percentage change
+    return {
+        'id': row.id,
+        'workout_date': row.workout_date,
+        'duration_minutes': row.duration_minutes,
+        'kettlebell_weight_kg': row.kettlebell_weight_kg,
+        'total_snatches': row.total_snatches,
+        'total_weight_moved_kg': row.total_weight_moved_kg,
+        'reps_per_interval': row.reps_per_interval,
+        'user_id': row.user_id,
+        'percentage_change_from_previous_same_weight': _percentage_change(
+            row.total_weight_moved_kg, row.previous_total_weight_moved_kg
+        )
+    }
+
+
 @app.route('/api/snatch_workouts', methods=['GET'])
 def get_all_snatch_workouts():
     try:
-        # Fetch workouts ordered by date ascending to make comparison easier
-        workouts_query = SnatchWorkout.query.order_by(SnatchWorkout.workout_date.asc()).all()
-        
-        processed_workouts = []
-        # Dictionary to keep track of the last total_weight_moved for each kettlebell weight
-        # Key: kettlebell_weight_kg, Value: last total_weight_moved_kg
-        last_total_weight_moved_by_kb = {}
-
-        for workout in workouts_query:
-            workout_dict = workout.to_dict() # Get the basic dictionary representation
-            percentage_change = None # Default to None
-
-            current_kb_weight = workout.kettlebell_weight_kg
-            current_total_weight_moved = workout.total_weight_moved_kg
-
-            if current_kb_weight in last_total_weight_moved_by_kb:
-                previous_total_weight_moved = last_total_weight_moved_by_kb[current_kb_weight]
-                if previous_total_weight_moved is not None and previous_total_weight_moved > 0: # Avoid division by zero or if previous was None
-                    change = current_total_weight_moved - previous_total_weight_moved
-                    percentage_change = (change / previous_total_weight_moved) * 100
-                    percentage_change = round(percentage_change, 2) # Round to 2 decimal places
-            
-            workout_dict['percentage_change_from_previous_same_weight'] = percentage_change
-            
-            # Update the last known total weight moved for this kettlebell weight
-            last_total_weight_moved_by_kb[current_kb_weight] = current_total_weight_moved
-            
-            processed_workouts.append(workout_dict)
-
-        # Optional: Re-sort by date descending for the API response (common for display)
-        processed_workouts.sort(key=lambda w: w['workout_date'], reverse=True)
-            
-        return jsonify(processed_workouts), 200
+        # Stream the array so memory stays flat however many workouts there are
+        return app.response_class(
+            stream_with_context(_stream_json_array(_workouts_with_percentage_change())),
+            status=200,
+            mimetype='application/json'
+        )
     except Exception as e:
         # Log the exception for debugging on the server
         app.logger.error(f"Error in get_all_snatch_workouts: {str(e)}") 
@@ -191,12 +340,17 @@ def register_user():
     if not username or not email or not password:
         return jsonify({"error": "Missing username, email, or password"}), 400
 
-    # Check if username already exists
-    if User.query.filter_by(username=username).first():
+    # Check whether the username or email is already taken, in a single query.
+    # At most two rows can match (one per unique column).
+    conflicts = db.session.execute(
+        db.select(User.username, User.email)
+        .where(db.or_(User.username == username, User.email == email))
+    ).all()
+
+    if any(row.username == username for row in conflicts):
         return jsonify({"error": "Username already exists"}), 409 # 409 Conflict
 
-    # Check if email already exists
-    if User.query.filter_by(email=email).first():
+    if conflicts:
         return jsonify({"error": "Email address already registered"}), 409 # 409 Conflict
 
     # Create new user
@@ -222,7 +376,13 @@ def register_user():
 
 # --- LOGIN ROUTE ---
 
+@app.errorhandler(429)
+def too_many_requests(e):
+    # Flask-Limiter's default 429 is an HTML page; keep errors JSON like the rest of the API
+    return jsonify({"error": "Too many login attempts, try again later"}), 429
+
 @app.route('/api/auth/login', methods=['POST'])
+@limiter.limit("5/minute") # Caps bcrypt work per client IP
 def login_user():
     data = request.get_json()
 
@@ -236,22 +396,36 @@ def login_user():
     if not identifier or not password:
         return jsonify({"error": "Missing identifier (username/email) or password"}), 400
 
-    # Try to find user by email first, then by username
-    user = User.query.filter_by(email=identifier).first()
-    if not user:
-        user = User.query.filter_by(username=identifier).first()
+    # Find the user by email or username in one query (both columns are unique-indexed).
+    # A username may equal another user's email, so an email match wins, as before.
+    user = db.session.scalar(
+        db.select(User)
+        .where(db.or_(User.email == identifier, User.username == identifier))
+        .order_by((User.email == identifier).desc())
+        .limit(1)
+    )
+
+    if user and user.check_password_cached(password):
+        # Upgrade hashes made with an older, cheaper work factor
+        if user.password_needs_rehash():
+            try:
+                user.set_password(password)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Error re-hashing password: {str(e)}")
 
-    if user and user.check_password(password):
         # Credentials are valid, generate JWT
         try:
+            now = datetime.now(timezone.utc)
             payload = {
-                'exp': datetime.now(timezone.utc) + app.config["JWT_EXPIRATION_DELTA"], # Expiration time
-                'iat': datetime.now(timezone.utc), # Issued at time
-                'sub': user.id # Subject of the token (user ID)
+                'exp': int((now + _JWT_TTL).timestamp()), # Expiration time
+                'iat': int(now.timestamp()), # Issued at time
+                'sub': str(user.id) # Subject of the token (user ID); jwt.decode requires a string
             }
-            token = jwt.encode(
-                payload,
-                app.config["SECRET_KEY"],
+            token = _jws.encode(
+                orjson.dumps(payload),
+                _JWT_SIGNING_KEY,
                 algorithm="HS256" # Standard algorithm for symmetric keys
             )
             return jsonify({"message": "Login successful!", "access_token": token}), 200
@@ -265,5 +439,9 @@ def login_user():
 
 
 
-if __name__ == '__main__':
-    app.run(debug=True, port=5001)
\ No newline at end of file
+# Flask's built-in server is for development only; set DEV_SERVER=1 to use it.
+# In production run gunicorn instead (see gunicorn.conf.py).
+if __name__ == '__main__' and os.environ.get('DEV_SERVER'):
+    app.run(debug=True, port=5001)
+elif __name__ == '__main__':
+    print("Set DEV_SERVER=1 to start the development server, or run: gunicorn -c gunicorn.conf.py wsgi:app")
@@ -0,0 +1,35 @@
+"""Pick a bcrypt work factor for this machine.
+
+Hashes a sample password at rounds 10..14 and prints the lowest value that
+takes at least 250ms. Use the result as BCRYPT_LOG_ROUNDS for the app:
+
+    python calibrate_bcrypt.py
+    export BCRYPT_LOG_ROUNDS=<printed value>
+"""
+import time
+import bcrypt
+
+TARGET_SECONDS = 0.25
+MIN_ROUNDS = 10
+MAX_ROUNDS = 14
+
+
+def time_hash(rounds, password=b'kettlebell-thunder-calibration'):
+    salt = bcrypt.gensalt(rounds=rounds)
+    start = time.perf_counter()
+    bcrypt.hashpw(password, salt)
+    return time.perf_counter() - start
+
+
+def calibrate():
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        elapsed = time_hash(rounds)
+        print(f"rounds={rounds}: {elapsed * 1000:.0f}ms")
+        if elapsed >= TARGET_SECONDS:
+            return rounds
+    return MAX_ROUNDS
+
+
+if __name__ == '__main__':
+    chosen = calibrate()
+    print(f"\nRecommended BCRYPT_LOG_ROUNDS={chosen}")
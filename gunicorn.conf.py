@@ -0,0 +1,14 @@
+# Gunicorn settings for Kettlebell Thunder Backend.
+# Run with: gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5001')
+
+# Several processes so slow bcrypt hashes on one core don't stall other requests
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Threads within each worker; bcrypt releases the GIL while hashing,
+# so a worker can serve DB-bound requests while a hash is in progress
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
@@ -0,0 +1,35 @@
+"""Compute SnatchWorkout.total_weight_moved_kg in the database
+
+Revision ID: 57acdd73701c
+Revises: c11ad3d8cc7d
+Create Date: 2026-10-15 14:37:09.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '57acdd73701c'
+down_revision = 'c11ad3d8cc7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite can't turn an existing column into a generated one, so drop the stored
+    # column and add a virtual one (requires SQLite 3.31+).
+    with op.batch_alter_table('snatch_workout', schema=None) as batch_op:
+        batch_op.drop_column('total_weight_moved_kg')
+
+    op.add_column('snatch_workout', sa.Column('total_weight_moved_kg', sa.Float(), sa.Computed('kettlebell_weight_kg * total_snatches', persisted=False)))
+
+
+def downgrade():
+    with op.batch_alter_table('snatch_workout', schema=None) as batch_op:
+        batch_op.drop_column('total_weight_moved_kg')
+
+    with op.batch_alter_table('snatch_workout', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_weight_moved_kg', sa.Float(), nullable=False, server_default='0'))
+
+    op.execute('UPDATE snatch_workout SET total_weight_moved_kg = kettlebell_weight_kg * total_snatches')
@@ -0,0 +1,3 @@
+# WSGI entry point for production servers, e.g.:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+from app import app